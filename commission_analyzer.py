@@ -2,6 +2,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 import pandas as pd
+import asyncio
+from data_cleaning import OPP_ID_PATTERN, clean_ad_spend, clean_crm, clean_finance, clean_marketing
 
 # Define the file paths (assuming they are in the same directory as the script)
 crm_file = 'crm_closed_deals.csv'
@@ -9,59 +11,81 @@ finance_file = 'finance_payments.csv'
 marketing_file = 'marketing_touches.csv'
 ad_spend_file = 'ad_spend.csv'
 
-print("--- Loading Data ---")
-
-# --- Load CRM Data ---
-try:
-    crm_df = pd.read_csv(crm_file)
-    print(f"\nSuccessfully loaded {crm_file} ({len(crm_df)} rows)")
-    print("CRM Data Head:")
-    print(crm_df.head())
-    print("\nCRM Data Info:")
-    crm_df.info()
-except FileNotFoundError:
-    print(f"Error: {crm_file} not found. Make sure it's in the same directory.")
-except Exception as e:
-    print(f"Error loading {crm_file}: {e}")
+# Reports folder, also home to the CRM deal and payment snapshots used to detect edits between runs
+report_dir = 'reports'
+crm_snapshot_file = f"{report_dir}/crm_deal_snapshot.csv"
+finance_snapshot_file = f"{report_dir}/finance_payment_snapshot.csv"
 
-# --- Load Finance Data ---
-try:
-    finance_df = pd.read_csv(finance_file)
-    print(f"\nSuccessfully loaded {finance_file} ({len(finance_df)} rows)")
-    print("Finance Data Head:")
-    print(finance_df.head())
-    print("\nFinance Data Info:")
-    finance_df.info()
-except FileNotFoundError:
-    print(f"Error: {finance_file} not found. Make sure it's in the same directory.")
-except Exception as e:
-    print(f"Error loading {finance_file}: {e}")
+# Base URL of the source APIs; when unset, the CSV exports above are used
+ingest_api_url = os.environ.get('INGEST_API_URL')
 
-# --- Load Marketing Data ---
-try:
-    marketing_df = pd.read_csv(marketing_file)
-    print(f"\nSuccessfully loaded {marketing_file} ({len(marketing_df)} rows)")
-    print("Marketing Data Head:")
-    print(marketing_df.head())
-    print("\nMarketing Data Info:")
-    marketing_df.info()
-except FileNotFoundError:
-    print(f"Error: {marketing_file} not found. Make sure it's in the same directory.")
-except Exception as e:
-    print(f"Error loading {marketing_file}: {e}")
+print("--- Loading Data ---")
 
-# --- Load Ad Spend Data ---
-try:
-    ad_spend_df = pd.read_csv(ad_spend_file)
-    print(f"\nSuccessfully loaded {ad_spend_file} ({len(ad_spend_df)} rows)")
-    print("Ad Spend Data Head:")
-    print(ad_spend_df.head())
-    print("\nAd Spend Data Info:")
-    ad_spend_df.info()
-except FileNotFoundError:
-    print(f"Error: {ad_spend_file} not found. Make sure it's in the same directory.")
-except Exception as e:
-    print(f"Error loading {ad_spend_file}: {e}")
+# --- Load Data from Source APIs (optional) ---
+# Set INGEST_API_URL (e.g. the mock server in mock_api_server.py) to stream the four sources
+# through the async connectors in ingest_connectors.py instead of reading the exported CSVs
+if ingest_api_url:
+    from ingest_connectors import ingest_all
+    print(f"\nIngesting data from {ingest_api_url}...")
+    ingested = asyncio.run(ingest_all(ingest_api_url))
+    crm_df = ingested['crm']
+    finance_df = ingested['finance']
+    marketing_df = ingested['marketing']
+    ad_spend_df = ingested['ad_spend']
+    for source, df in ingested.items():
+        print(f"Successfully ingested {source} data ({len(df)} rows)")
+else:
+    # --- Load CRM Data ---
+    try:
+        crm_df = pd.read_csv(crm_file)
+        print(f"\nSuccessfully loaded {crm_file} ({len(crm_df)} rows)")
+        print("CRM Data Head:")
+        print(crm_df.head())
+        print("\nCRM Data Info:")
+        crm_df.info()
+    except FileNotFoundError:
+        print(f"Error: {crm_file} not found. Make sure it's in the same directory.")
+    except Exception as e:
+        print(f"Error loading {crm_file}: {e}")
+
+    # --- Load Finance Data ---
+    try:
+        finance_df = pd.read_csv(finance_file)
+        print(f"\nSuccessfully loaded {finance_file} ({len(finance_df)} rows)")
+        print("Finance Data Head:")
+        print(finance_df.head())
+        print("\nFinance Data Info:")
+        finance_df.info()
+    except FileNotFoundError:
+        print(f"Error: {finance_file} not found. Make sure it's in the same directory.")
+    except Exception as e:
+        print(f"Error loading {finance_file}: {e}")
+
+    # --- Load Marketing Data ---
+    try:
+        marketing_df = pd.read_csv(marketing_file)
+        print(f"\nSuccessfully loaded {marketing_file} ({len(marketing_df)} rows)")
+        print("Marketing Data Head:")
+        print(marketing_df.head())
+        print("\nMarketing Data Info:")
+        marketing_df.info()
+    except FileNotFoundError:
+        print(f"Error: {marketing_file} not found. Make sure it's in the same directory.")
+    except Exception as e:
+        print(f"Error loading {marketing_file}: {e}")
+
+    # --- Load Ad Spend Data ---
+    try:
+        ad_spend_df = pd.read_csv(ad_spend_file)
+        print(f"\nSuccessfully loaded {ad_spend_file} ({len(ad_spend_df)} rows)")
+        print("Ad Spend Data Head:")
+        print(ad_spend_df.head())
+        print("\nAd Spend Data Info:")
+        ad_spend_df.info()
+    except FileNotFoundError:
+        print(f"Error: {ad_spend_file} not found. Make sure it's in the same directory.")
+    except Exception as e:
+        print(f"Error loading {ad_spend_file}: {e}")
 
 print("\n--- Data Loading Complete ---")
 
@@ -69,55 +93,22 @@ print("\n--- Data Loading Complete ---")
 # --- Data Cleaning & Preparation ---
 print("\n--- Cleaning and Preparing Data ---")
 
-# Convert Date Columns
-print("Converting date columns...")
-try:
-    crm_df['CloseDate'] = pd.to_datetime(crm_df['CloseDate'])
-    finance_df['PaymentDate'] = pd.to_datetime(finance_df['PaymentDate'])
-    # errors='coerce' will turn invalid date formats into NaT (Not a Time)
-    marketing_df['TouchpointDate'] = pd.to_datetime(marketing_df['TouchpointDate'], errors='coerce')
-    ad_spend_df['Date'] = pd.to_datetime(ad_spend_df['Date'])
-    print("Date columns converted.")
-except Exception as e:
-    print(f"Error converting date columns: {e}")
-
-# Ensure Numeric Types (read_csv usually handles this well, but explicit check is good)
-print("Ensuring numeric types...")
-numeric_cols_crm = ['Amount']
-numeric_cols_finance = ['Amount']
-numeric_cols_ad = ['Spend', 'Impressions', 'Clicks']
-
-for col in numeric_cols_crm:
-    crm_df[col] = pd.to_numeric(crm_df[col], errors='coerce')
-for col in numeric_cols_finance:
-    finance_df[col] = pd.to_numeric(finance_df[col], errors='coerce')
-for col in numeric_cols_ad:
-    ad_spend_df[col] = pd.to_numeric(ad_spend_df[col], errors='coerce')
-print("Numeric types ensured.")
-
-
-# Handle Missing Values (Example: Fill missing AssociatedOpportunityID with a placeholder)
-print("Handling missing values...")
-if 'AssociatedOpportunityID' in marketing_df.columns:
-    marketing_df['AssociatedOpportunityID'].fillna('MISSING', inplace=True)
-    print("Filled missing AssociatedOpportunityID in marketing data.")
-# Drop rows where essential numeric data might be missing after coercion
-crm_df.dropna(subset=numeric_cols_crm, inplace=True)
-finance_df.dropna(subset=numeric_cols_finance, inplace=True)
-ad_spend_df.dropna(subset=numeric_cols_ad, inplace=True)
-print("Dropped rows with missing essential numeric values.")
-
-
-# --- Prepare Finance Data for Reconciliation ---
-# Attempt to extract OpportunityID from the Description field
-print("Extracting potential Opportunity IDs from finance descriptions...")
-# Regex to find Salesforce-like IDs (006 followed by alphanumerics)
-opp_id_pattern = r'(006[a-zA-Z0-9]{12,15})' # Pattern for 15 or 18 char IDs starting with 006
-
-# Create a new column 'ExtractedOppID'
-# .str.extract finds the first match of the pattern in the 'Description' column
-finance_df['ExtractedOppID'] = finance_df['Description'].str.extract(opp_id_pattern)
-
+# The cleaning rules live in data_cleaning.py so API pages and CSV exports are cleaned identically
+if ingest_api_url:
+    # API pages were already cleaned one by one as they streamed in
+    print("Data was cleaned page by page during ingestion.")
+else:
+    print("Converting date columns, ensuring numeric types and handling missing values...")
+    try:
+        crm_df = clean_crm(crm_df)
+        finance_df = clean_finance(finance_df)
+        marketing_df = clean_marketing(marketing_df)
+        ad_spend_df = clean_ad_spend(ad_spend_df)
+        print("Data cleaned. Dropped rows with missing essential numeric values.")
+    except Exception as e:
+        print(f"Error cleaning data: {e}")
+
+# Finance descriptions are messy; OpportunityIDs are extracted into 'ExtractedOppID' for reconciliation
 print("Potential Opportunity IDs extracted. Example:")
 print(finance_df[['Description', 'ExtractedOppID']].head(10)) # Show first 10 results
 
@@ -131,13 +122,164 @@ print("\nFinance Data Info (Post-Cleaning):")
 finance_df.info()
 # Add info() calls for marketing_df and ad_spend_df if desired
 
+# --- Change Capture: Detect CRM Deal & Payment Edits Since Last Run ---
+print("\n--- Detecting CRM Deal & Payment Changes Since Last Run ---")
+
+# Deals and payments get edited after the fact (Amount revised, owner reassigned, stage flipped, payment refunded)
+# Fingerprint every row in one vectorized hash and compare against the last run's snapshot
+def detect_changes(current_df, key_col, fingerprint_cols, snapshot_file, date_cols):
+    fingerprints = current_df[[key_col] + fingerprint_cols].copy()
+    # Hashes are kept as strings so they survive the CSV round trip and outer-merge NaNs without float rounding
+    fingerprints['RowHash'] = pd.util.hash_pandas_object(fingerprints[fingerprint_cols], index=False).astype(str)
+
+    if os.path.exists(snapshot_file):
+        previous_snapshot = pd.read_csv(snapshot_file, parse_dates=date_cols, dtype={'RowHash': str})
+        print(f"Loaded previous snapshot {snapshot_file} ({len(previous_snapshot)} rows)")
+    else:
+        previous_snapshot = fingerprints.iloc[0:0].copy() # Empty snapshot with the same columns
+        print(f"No previous snapshot {snapshot_file} found - all rows will be treated as inserted.")
+
+    # Outer merge on the key: left_only = deleted, right_only = inserted, both = possibly updated
+    changes = pd.merge(
+        previous_snapshot,
+        fingerprints,
+        on=key_col,
+        how='outer',
+        suffixes=('_prev', '_curr'),
+        indicator=True
+    )
+    changes = changes[(changes['_merge'] != 'both') | (changes['RowHash_prev'] != changes['RowHash_curr'])].copy()
+    changes['ChangeType'] = changes['_merge'].map(
+        {'left_only': 'Deleted', 'right_only': 'Inserted', 'both': 'Updated'}
+    ).astype(str)
+
+    # Record *why* an updated row changed: the list of fields whose values differ
+    changes['ChangedFields'] = ''
+    for col in fingerprint_cols:
+        prev_values = changes[f'{col}_prev']
+        curr_values = changes[f'{col}_curr']
+        field_changed = (
+            (prev_values != curr_values) &
+            ~(prev_values.isna() & curr_values.isna()) & # Missing on both sides is not a change
+            (changes['ChangeType'] == 'Updated')
+        )
+        changes.loc[field_changed, 'ChangedFields'] += col + '; '
+    changes['ChangedFields'] = changes['ChangedFields'].str.rstrip('; ')
+    changes = changes.drop(columns=['_merge'])
+
+    print(f"Detected {(changes['ChangeType'] == 'Inserted').sum()} inserted, "
+          f"{(changes['ChangeType'] == 'Updated').sum()} updated and "
+          f"{(changes['ChangeType'] == 'Deleted').sum()} deleted rows.")
+    return fingerprints, previous_snapshot, changes
+
+deal_fingerprint_cols = ['AccountName', 'Amount', 'CloseDate', 'OwnerName', 'StageName', 'ProductType', 'LeadSource']
+crm_fingerprints, previous_crm_snapshot, deal_changes = detect_changes(
+    crm_df, 'OpportunityID', deal_fingerprint_cols, crm_snapshot_file, ['CloseDate']
+)
+print(deal_changes[deal_changes['ChangeType'] == 'Updated'][['OpportunityID', 'ChangedFields']].head(10))
+
+payment_fingerprint_cols = ['Amount', 'PaymentDate', 'Description', 'Status']
+finance_fingerprints, previous_finance_snapshot, payment_changes = detect_changes(
+    finance_df, 'PaymentID', payment_fingerprint_cols, finance_snapshot_file, ['PaymentDate']
+)
+# A payment belongs to whichever deal its description pointed at, before and after the edit
+previous_finance_snapshot['ExtractedOppID'] = previous_finance_snapshot['Description'].str.extract(OPP_ID_PATTERN, expand=False)
+payment_changes['ExtractedOppID_prev'] = payment_changes['Description_prev'].str.extract(OPP_ID_PATTERN, expand=False)
+payment_changes['ExtractedOppID_curr'] = payment_changes['Description_curr'].str.extract(OPP_ID_PATTERN, expand=False)
+print(payment_changes[payment_changes['ChangeType'] == 'Updated'][['PaymentID', 'ChangedFields']].head(10))
+
+# Only some deal fields feed each total: commissions follow owner, stage and product,
+# campaign revenue follows amount, stage and lead source. Inserts and deletes move both.
+def deal_change_touches(fields):
+    return (deal_changes['ChangeType'] != 'Updated') | deal_changes['ChangedFields'].str.contains('|'.join(fields))
+
+# One row per (deal, reason): every change is traced back to the deal whose totals it moves
+deal_causes = pd.DataFrame({
+    'OpportunityID': deal_changes['OpportunityID'],
+    'ChangeSource': 'Deal',
+    'AffectsCommission': deal_change_touches(['OwnerName', 'StageName', 'ProductType']),
+    'AffectsRevenue': deal_change_touches(['Amount', 'StageName', 'LeadSource']),
+    'Cause': deal_changes['OpportunityID'] + ' deal ' + deal_changes['ChangeType'].str.lower() +
+             (' (' + deal_changes['ChangedFields'] + ')').where(deal_changes['ChangedFields'] != '', '')
+})
+payment_cause_text = (
+    ' payment ' + payment_changes['PaymentID'] + ' ' + payment_changes['ChangeType'].str.lower() +
+    (' (' + payment_changes['ChangedFields'] + ')').where(payment_changes['ChangedFields'] != '', '')
+)
+payment_causes = pd.concat([
+    pd.DataFrame({'OpportunityID': payment_changes[opp_col], 'ChangeSource': 'Payment',
+                  'AffectsCommission': True, 'AffectsRevenue': False, # Revenue comes from CRM deal amounts
+                  'Cause': payment_changes[opp_col] + payment_cause_text})
+    for opp_col in ['ExtractedOppID_prev', 'ExtractedOppID_curr']
+])
+change_causes = pd.concat([deal_causes, payment_causes]).dropna(subset=['OpportunityID']).drop_duplicates()
+commission_causes = change_causes[change_causes['AffectsCommission']]
+revenue_causes = change_causes[change_causes['AffectsRevenue']]
+changed_opp_ids = commission_causes['OpportunityID'].unique()
+
+# Map deals to the (rep, payment quarter) commission groups their payments and refunds land in
+def map_deals_to_commission_groups(deals, payments, opp_ids):
+    linked = pd.merge(
+        payments.loc[
+            payments['ExtractedOppID'].isin(opp_ids) & payments['Status'].isin(['succeeded', 'refunded']), # Failed payments never count
+            ['ExtractedOppID', 'PaymentDate']
+        ],
+        deals.loc[deals['StageName'] == 'Closed Won', ['OpportunityID', 'OwnerName']],
+        left_on='ExtractedOppID',
+        right_on='OpportunityID',
+        how='inner'
+    )
+    # Same quarter-end label the commission report's pd.Grouper(freq='QE') produces
+    linked['PaymentDate'] = linked['PaymentDate'].dt.to_period('Q').dt.end_time.dt.normalize()
+    return linked[['OwnerName', 'PaymentDate', 'OpportunityID']]
+
+# Both the old and the new state count - a reassigned deal moves money away from one rep and to another
+commission_lineage = pd.concat([
+    map_deals_to_commission_groups(previous_crm_snapshot, previous_finance_snapshot, changed_opp_ids),
+    map_deals_to_commission_groups(crm_df, finance_df, changed_opp_ids)
+]).drop_duplicates()
+affected_commission_groups = commission_lineage[['OwnerName', 'PaymentDate']].drop_duplicates()
+affected_reps = affected_commission_groups['OwnerName'].unique()
+affected_quarters = affected_commission_groups['PaymentDate'].unique()
+
+print(f"Changes touch {len(changed_opp_ids)} deals in {len(affected_commission_groups)} rep/quarter commission groups.")
+
+# --- Incremental Recompute Scope ---
+# With last run's snapshots and reports on disk, only the affected groups are recomputed and the rest
+# are carried over from the previous reports. Set FULL_RECOMPUTE=1 to force a full pass.
+previous_commission_file = f"{report_dir}/final_commission_report.csv"
+previous_roi_file = f"{report_dir}/marketing_roi_report.csv"
+incremental_run = (
+    os.environ.get('FULL_RECOMPUTE') != '1' and
+    len(previous_crm_snapshot) > 0 and len(previous_finance_snapshot) > 0 and
+    os.path.exists(previous_commission_file) and os.path.exists(previous_roi_file)
+)
+
+if incremental_run:
+    previous_commission_report = pd.read_csv(previous_commission_file, parse_dates=['PaymentDate'])
+    previous_roi_report = pd.read_csv(previous_roi_file)
+
+    # A group's totals (and tier bonus) depend on every payment in it, so recompute all payments of the
+    # affected reps' deals in the affected quarters. Refunds of those deals are kept for every quarter
+    # because any refund on a deal flags its payments for clawback.
+    scoped_opp_ids = crm_df.loc[crm_df['OwnerName'].isin(affected_reps), 'OpportunityID']
+    payment_quarters = finance_df['PaymentDate'].dt.to_period('Q').dt.end_time.dt.normalize()
+    refund_scope = finance_df['ExtractedOppID'].isin(scoped_opp_ids)
+    payment_scope = refund_scope & payment_quarters.isin(affected_quarters)
+    print(f"Incremental run: recomputing {payment_scope.sum()} of {len(finance_df)} payments.")
+else:
+    previous_commission_report = pd.DataFrame()
+    previous_roi_report = pd.DataFrame()
+    payment_scope = refund_scope = pd.Series(True, index=finance_df.index)
+    print("Full run: recomputing all commissions and ROI.")
+
 # Next step: Reconcile CRM and Finance data
 # --- Reconcile CRM and Finance Data ---
 print("\n--- Reconciling CRM Deals and Finance Payments ---")
 
 # Filter for only Closed Won deals and successful payments (exclude refunds for reconciliation)
 closed_won_df = crm_df[crm_df['StageName'] == 'Closed Won'].copy()
-successful_payments_df = finance_df[finance_df['Status'] == 'succeeded'].copy()
+successful_payments_df = finance_df[(finance_df['Status'] == 'succeeded') & payment_scope].copy()
 
 # --- Reconciliation Strategy ---
 # We prioritize matching using the ExtractedOppID first.
@@ -204,7 +346,7 @@ print(reconciled_data[['PaymentID', 'Amount_payment', 'ProductType', 'BaseCommis
 
 # --- Handle Refunds (for Clawbacks) ---
 print("Identifying refunds for potential clawbacks...")
-refund_df = finance_df[finance_df['Status'] == 'refunded'].copy()
+refund_df = finance_df[(finance_df['Status'] == 'refunded') & refund_scope].copy()
 # Try to link refunds back to original payments/deals if possible (using ExtractedOppID)
 # This simple version just flags deals that had *any* refund associated via OppID
 refunded_opp_ids = refund_df['ExtractedOppID'].dropna().unique()
@@ -314,6 +456,22 @@ final_commission_report['FinalCommission'] = (
     final_commission_report['TotalClawback']
 )
 
+# Incremental run: keep only the recomputed affected groups and carry every other group over from last run
+if incremental_run:
+    recomputed_groups = pd.merge(final_commission_report, affected_commission_groups, on=['OwnerName', 'PaymentDate'])
+    carried_groups = pd.merge(
+        previous_commission_report,
+        affected_commission_groups,
+        on=['OwnerName', 'PaymentDate'],
+        how='left',
+        indicator=True
+    )
+    carried_groups = carried_groups[carried_groups['_merge'] == 'left_only'][final_commission_report.columns]
+    final_commission_report = pd.concat([carried_groups, recomputed_groups]).sort_values(
+        ['OwnerName', 'PaymentDate']
+    ).reset_index(drop=True)
+    print(f"Recomputed {len(recomputed_groups)} rep/quarter groups, carried over {len(carried_groups)} unchanged.")
+
 print("Final Commission Report by Rep & Quarter:")
 print(final_commission_report.to_string()) # .to_string() prints all rows
 
@@ -345,12 +503,30 @@ def map_generic_source(source):
 # Use .loc to safely modify the DataFrame
 deals_from_ads.loc[:, 'CampaignName'] = deals_from_ads['LeadSource'].apply(map_generic_source)
 
+# Campaign revenue only moves when a deal feeding it changed (old or new lead source)
+revenue_deal_changes = deal_changes[deal_changes['OpportunityID'].isin(revenue_causes['OpportunityID'])]
+campaign_lineage = pd.concat([
+    pd.DataFrame({'CampaignName': revenue_deal_changes[source_col].dropna().apply(map_generic_source),
+                  'OpportunityID': revenue_deal_changes.loc[revenue_deal_changes[source_col].notna(), 'OpportunityID']})
+    for source_col in ['LeadSource_prev', 'LeadSource_curr']
+]).drop_duplicates()
+affected_campaigns = campaign_lineage['CampaignName'].unique()
+if incremental_run:
+    deals_from_ads = deals_from_ads[deals_from_ads['CampaignName'].isin(affected_campaigns)]
+
 # 3. Calculate Revenue per Campaign
 revenue_per_campaign = deals_from_ads.groupby('CampaignName').agg(
     TotalRevenue=('Amount', 'sum'),
     TotalDeals=('OpportunityID', 'count')
 ).reset_index()
 
+# Incremental run: unaffected campaigns keep last run's revenue (spend is always re-summed above)
+if incremental_run:
+    carried_revenue = previous_roi_report.loc[
+        ~previous_roi_report['CampaignName'].isin(affected_campaigns), ['CampaignName', 'TotalRevenue', 'TotalDeals']
+    ]
+    revenue_per_campaign = pd.concat([carried_revenue, revenue_per_campaign], ignore_index=True)
+
 # 4. Merge Spend and Revenue to get ROAS/CPA
 roi_report = pd.merge(
     ad_spend_summary,
@@ -371,6 +547,184 @@ roi_report.loc[roi_report['TotalDeals'] > 0, 'AvgCPA'] = (roi_report['TotalSpend
 print("\nMarketing ROI Report (Simple Attribution):")
 print(roi_report.to_string())
 
+# --- Funnel Velocity & Time-to-Close ---
+print("\n--- Calculating Funnel Velocity & Time-to-Close ---")
+
+# Only touches with a valid date can be placed in the funnel
+# Keep just the columns we need so this stays cheap on very large touch exports
+funnel_touches = marketing_df.loc[
+    marketing_df['TouchpointDate'].notna(),
+    ['ContactEmail', 'TouchpointDate', 'CampaignSource', 'ActionType', 'AssociatedOpportunityID']
+]
+
+# Attach each deal-linked touch to its deal in one merge (touches pointing at unknown OppIDs drop out)
+deal_touches = pd.merge(
+    funnel_touches,
+    crm_df[['OpportunityID', 'CloseDate', 'OwnerName', 'StageName']],
+    left_on='AssociatedOpportunityID',
+    right_on='OpportunityID',
+    how='inner'
+)
+# Touches logged after the close day can't have influenced the deal (touches carry a time, CloseDate doesn't)
+deal_touches = deal_touches[deal_touches['TouchpointDate'].dt.normalize() <= deal_touches['CloseDate']]
+
+# Sort once, then a single grouped pass picks each deal's first touch and counts its touches
+# (no per-deal loops - the group keeps the sorted order, so 'first' is the earliest touch;
+# campaign and action break same-timestamp ties so the result doesn't depend on input row order)
+deal_touches = deal_touches.sort_values(['OpportunityID', 'TouchpointDate', 'CampaignSource', 'ActionType'])
+deal_funnel = deal_touches.groupby('OpportunityID', sort=False).agg(
+    FirstTouchDate=('TouchpointDate', 'first'),
+    FirstCampaign=('CampaignSource', 'first'),
+    FirstAction=('ActionType', 'first'),
+    TouchesBeforeClose=('TouchpointDate', 'size'),
+    CloseDate=('CloseDate', 'first'),
+    OwnerName=('OwnerName', 'first')
+).reset_index()
+
+deal_funnel['DaysToClose'] = (deal_funnel['CloseDate'] - deal_funnel['FirstTouchDate'].dt.normalize()).dt.days
+
+print(f"Linked first touches to {len(deal_funnel)} deals. Example:")
+print(deal_funnel[['OpportunityID', 'FirstTouchDate', 'FirstCampaign', 'FirstAction', 'TouchesBeforeClose', 'DaysToClose']].head())
+
+# Conversion has to count the leads that never converted too, so it's measured per lead (ContactEmail)
+# over all touches: a lead converted if any of its touches links to a Closed Won deal
+funnel_touches = funnel_touches.assign(
+    IsWonTouch=funnel_touches['AssociatedOpportunityID'].isin(closed_won_df['OpportunityID'])
+).sort_values(['ContactEmail', 'TouchpointDate', 'CampaignSource', 'ActionType'])
+lead_funnel = funnel_touches.groupby('ContactEmail', sort=False).agg(
+    FirstTouchDate=('TouchpointDate', 'first'),
+    FirstCampaign=('CampaignSource', 'first'),
+    FirstAction=('ActionType', 'first'),
+    Converted=('IsWonTouch', 'any')
+).reset_index()
+
+print(f"Found first touches for {len(lead_funnel)} leads, {lead_funnel['Converted'].sum()} of them converted.")
+
+# Summarize first-touch-to-close velocity for one dimension, cohorted by close quarter
+def summarize_funnel(deals, group_col):
+    summary = deals.groupby(
+        [group_col, pd.Grouper(key='CloseDate', freq='QE')] # Group by dimension and Quarter
+    ).agg(
+        TotalDeals=('OpportunityID', 'count'),
+        AvgDaysToClose=('DaysToClose', 'mean'),
+        MedianDaysToClose=('DaysToClose', 'median'),
+        AvgTouchesBeforeClose=('TouchesBeforeClose', 'mean')
+    ).reset_index()
+
+    summary['AvgDaysToClose'] = summary['AvgDaysToClose'].round(1)
+    summary['AvgTouchesBeforeClose'] = summary['AvgTouchesBeforeClose'].round(1)
+    return summary
+
+# Summarize lead conversion for one first-touch dimension, cohorted by first-touch quarter
+def summarize_conversion(leads, group_col):
+    summary = leads.groupby(
+        [group_col, pd.Grouper(key='FirstTouchDate', freq='QE')] # Group by dimension and Quarter
+    ).agg(
+        TotalLeads=('ContactEmail', 'count'),
+        ConvertedLeads=('Converted', 'sum')
+    ).reset_index()
+
+    summary['ConversionRate'] = (summary['ConvertedLeads'] / summary['TotalLeads']).round(2)
+    return summary
+
+funnel_by_campaign = summarize_funnel(deal_funnel, 'FirstCampaign')
+conversion_by_campaign = summarize_conversion(lead_funnel, 'FirstCampaign')
+conversion_by_action = summarize_conversion(lead_funnel, 'FirstAction')
+
+# Reps own deals rather than leads, so their conversion is the win rate over every deal they closed
+rep_win_rates = crm_df.assign(IsWon=crm_df['StageName'] == 'Closed Won').groupby(
+    ['OwnerName', pd.Grouper(key='CloseDate', freq='QE')] # Group by Rep and Quarter
+).agg(
+    ClosedDeals=('OpportunityID', 'count'),
+    WonDeals=('IsWon', 'sum')
+).reset_index()
+rep_win_rates['ConversionRate'] = (rep_win_rates['WonDeals'] / rep_win_rates['ClosedDeals']).round(2)
+
+funnel_by_rep = pd.merge(
+    rep_win_rates,
+    summarize_funnel(deal_funnel, 'OwnerName'),
+    on=['OwnerName', 'CloseDate'],
+    how='left'
+).fillna({'TotalDeals': 0})
+
+print("\nFunnel Velocity by First-Touch Campaign & Quarter:")
+print(funnel_by_campaign.to_string())
+print("\nLead Conversion by First-Touch Campaign & Quarter:")
+print(conversion_by_campaign.to_string())
+print("\nFunnel Velocity & Win Rate by Rep & Quarter:")
+print(funnel_by_rep.to_string())
+print("\nLead Conversion by First Action Type & Quarter:")
+print(conversion_by_action.to_string())
+
+# --- Change Audit: What Changed and Why Totals Moved ---
+print("\n--- Auditing Impact of CRM Deal & Payment Changes ---")
+
+# Row-level audit: one row per changed deal / payment with before and after values of the fields that drive totals
+deal_change_audit = deal_changes[[
+    'OpportunityID', 'ChangeType', 'ChangedFields',
+    'Amount_prev', 'Amount_curr', 'OwnerName_prev', 'OwnerName_curr',
+    'StageName_prev', 'StageName_curr', 'LeadSource_prev', 'LeadSource_curr'
+]]
+payment_change_audit = payment_changes[[
+    'PaymentID', 'ChangeType', 'ChangedFields', 'ExtractedOppID_prev', 'ExtractedOppID_curr',
+    'Amount_prev', 'Amount_curr', 'PaymentDate_prev', 'PaymentDate_curr', 'Status_prev', 'Status_curr'
+]]
+
+# Collapse the causes behind each moved total into one readable row
+def summarize_causes(lineage, causes, group_cols):
+    return pd.merge(lineage, causes, on='OpportunityID').groupby(group_cols).agg(
+        ChangedDeals=('OpportunityID', lambda ids: '; '.join(sorted(ids.unique()))),
+        ChangeReasons=('Cause', lambda reasons: '; '.join(sorted(reasons.unique())))
+    ).reset_index()
+
+# Compare this run's totals with last run's, only for the (rep, quarter) groups the changed deals' payments land in
+commission_change_audit = pd.DataFrame()
+roi_change_audit = pd.DataFrame()
+if incremental_run:
+    commission_change_audit = pd.merge(
+        summarize_causes(commission_lineage, commission_causes, ['OwnerName', 'PaymentDate']),
+        pd.merge(
+            previous_commission_report[['OwnerName', 'PaymentDate', 'TotalPaid', 'TotalClawback', 'FinalCommission']],
+            final_commission_report[['OwnerName', 'PaymentDate', 'TotalPaid', 'TotalClawback', 'FinalCommission']],
+            on=['OwnerName', 'PaymentDate'],
+            how='outer',
+            suffixes=('_prev', '_curr')
+        ).fillna(0),
+        on=['OwnerName', 'PaymentDate'],
+        how='inner' # Refund-only quarters never make it into the commission report
+    )
+    commission_change_audit['CommissionDelta'] = (
+        commission_change_audit['FinalCommission_curr'] - commission_change_audit['FinalCommission_prev']
+    ).round(2)
+    commission_change_audit['ClawbackDelta'] = (
+        commission_change_audit['TotalClawback_curr'] - commission_change_audit['TotalClawback_prev']
+    ).round(2)
+
+    roi_change_audit = pd.merge(
+        summarize_causes(campaign_lineage, revenue_causes, ['CampaignName']),
+        pd.merge(
+            previous_roi_report[['CampaignName', 'TotalRevenue', 'TotalDeals', 'ROAS']],
+            roi_report[['CampaignName', 'TotalRevenue', 'TotalDeals', 'ROAS']],
+            on='CampaignName',
+            how='outer',
+            suffixes=('_prev', '_curr')
+        ).fillna(0),
+        on='CampaignName',
+        how='inner' # Campaigns without ad spend aren't in the ROI report
+    )
+    roi_change_audit['RevenueDelta'] = (
+        roi_change_audit['TotalRevenue_curr'] - roi_change_audit['TotalRevenue_prev']
+    ).round(2)
+
+print("\nDeal Change Audit:")
+print(deal_change_audit.head(20).to_string())
+print("\nPayment Change Audit:")
+print(payment_change_audit.head(20).to_string())
+print("\nCommission Movement by Rep & Quarter (with causes):")
+print(commission_change_audit.to_string())
+print("\nROI Movement by Campaign (with causes):")
+print(roi_change_audit.to_string())
+
 # --- Implement Lead Scoring Logic ---
 print("\n--- Scoring Leads based on Marketing Touches ---")
 
@@ -423,6 +777,8 @@ print("\nFinal Commission Report:")
 print(final_commission_report.to_string())
 print("\nMarketing ROI Report:")
 print(roi_report.to_string())
+print("\nFunnel Velocity by Campaign:")
+print(funnel_by_campaign.to_string())
 print("\nTop Lead Scores:")
 print(lead_scores.head(20).to_string())
 
@@ -432,7 +788,6 @@ print("\n--- Analysis Complete ---")
 print("\n--- Phase 3: Saving Reports & Visualizations ---")
 
 # Create a directory to store reports if it doesn't exist
-report_dir = 'reports'
 if not os.path.exists(report_dir):
     os.makedirs(report_dir)
     print(f"Created directory: {report_dir}")
@@ -441,7 +796,18 @@ if not os.path.exists(report_dir):
 try:
     final_commission_report.to_csv(f"{report_dir}/final_commission_report.csv", index=False)
     roi_report.to_csv(f"{report_dir}/marketing_roi_report.csv", index=False)
+    funnel_by_campaign.to_csv(f"{report_dir}/funnel_velocity_by_campaign.csv", index=False)
+    funnel_by_rep.to_csv(f"{report_dir}/funnel_velocity_by_rep.csv", index=False)
+    conversion_by_campaign.to_csv(f"{report_dir}/funnel_conversion_by_campaign.csv", index=False)
+    conversion_by_action.to_csv(f"{report_dir}/funnel_conversion_by_action.csv", index=False)
     lead_scores.to_csv(f"{report_dir}/top_lead_scores.csv", index=False)
+    deal_change_audit.to_csv(f"{report_dir}/crm_deal_change_audit.csv", index=False)
+    payment_change_audit.to_csv(f"{report_dir}/finance_payment_change_audit.csv", index=False)
+    commission_change_audit.to_csv(f"{report_dir}/commission_change_audit.csv", index=False)
+    roi_change_audit.to_csv(f"{report_dir}/roi_change_audit.csv", index=False)
+    # Snapshot this run's deal and payment fingerprints so the next run can detect edits
+    crm_fingerprints.to_csv(crm_snapshot_file, index=False)
+    finance_fingerprints.to_csv(finance_snapshot_file, index=False)
     print("Successfully saved final reports to CSV files in 'reports/' folder.")
 except Exception as e:
     print(f"Error saving reports to CSV: {e}")
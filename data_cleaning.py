@@ -0,0 +1,49 @@
+import pandas as pd
+
+# --- Configuration ---
+# Regex to find Salesforce-like IDs (006 followed by alphanumerics)
+OPP_ID_PATTERN = r'(006[a-zA-Z0-9]{12,15})' # Pattern for 15 or 18 char IDs starting with 006
+
+NUMERIC_COLS_CRM = ['Amount']
+NUMERIC_COLS_FINANCE = ['Amount']
+NUMERIC_COLS_AD = ['Spend', 'Impressions', 'Clicks']
+
+
+# --- Cleaning Functions ---
+# Each takes one raw frame (a whole CSV export or a single API page) and returns it cleaned,
+# so the same rules apply whether data is loaded in one go or streamed page by page.
+def clean_crm(crm_df):
+    """Converts CloseDate and Amount, dropping deals without a usable Amount."""
+    crm_df['CloseDate'] = pd.to_datetime(crm_df['CloseDate'])
+    for col in NUMERIC_COLS_CRM:
+        crm_df[col] = pd.to_numeric(crm_df[col], errors='coerce')
+    return crm_df.dropna(subset=NUMERIC_COLS_CRM)
+
+
+def clean_finance(finance_df):
+    """Converts PaymentDate and Amount, drops payments without an Amount and extracts OpportunityIDs."""
+    finance_df['PaymentDate'] = pd.to_datetime(finance_df['PaymentDate'])
+    for col in NUMERIC_COLS_FINANCE:
+        finance_df[col] = pd.to_numeric(finance_df[col], errors='coerce')
+
+    # .str.extract finds the first match of the pattern in the messy 'Description' field
+    # (astype(object) keeps .str usable on a page where every Description is missing)
+    finance_df['ExtractedOppID'] = finance_df['Description'].astype(object).str.extract(OPP_ID_PATTERN, expand=False)
+    return finance_df.dropna(subset=NUMERIC_COLS_FINANCE)
+
+
+def clean_marketing(marketing_df):
+    """Converts TouchpointDate (invalid dates become NaT) and fills missing AssociatedOpportunityIDs."""
+    # errors='coerce' will turn invalid date formats into NaT (Not a Time)
+    marketing_df['TouchpointDate'] = pd.to_datetime(marketing_df['TouchpointDate'], errors='coerce')
+    if 'AssociatedOpportunityID' in marketing_df.columns:
+        marketing_df['AssociatedOpportunityID'] = marketing_df['AssociatedOpportunityID'].fillna('MISSING')
+    return marketing_df
+
+
+def clean_ad_spend(ad_spend_df):
+    """Converts Date and the spend metrics, dropping rows without usable metrics."""
+    ad_spend_df['Date'] = pd.to_datetime(ad_spend_df['Date'])
+    for col in NUMERIC_COLS_AD:
+        ad_spend_df[col] = pd.to_numeric(ad_spend_df[col], errors='coerce')
+    return ad_spend_df.dropna(subset=NUMERIC_COLS_AD)
\ No newline at end of file
@@ -0,0 +1,403 @@
+import argparse
+import asyncio
+import collections
+import random
+import time
+import tracemalloc
+
+import httpx
+import pandas as pd
+
+from data_cleaning import clean_ad_spend, clean_crm, clean_finance, clean_marketing
+
+# --- Configuration ---
+PAGE_SIZE = 1000 # Requested page size, capped by each API's own maximum
+HUBSPOT_PARTITIONS = 8 # Object id ranges searched concurrently
+SYNC_WINDOWS_START = '2025-01-01' # Date-filtered APIs are read as concurrent monthly windows from here on
+MAX_CONNECTIONS = 16 # Shared connection pool across all sources
+MAX_RETRIES = 5 # Transport errors and 5xx responses; 429s have their own, time-based budget
+RATE_LIMIT_MAX_WAIT_SECONDS = 300.0 # Longest one request keeps retrying while rate limited
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_MAX_SECONDS = 10.0
+QUEUE_PAGES = 32 # Pages buffered per source before fetchers wait for the cleaning step to catch up
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+
+# Client-side pacing (see AdaptiveRateLimiter)
+RATE_DECREASE = 0.5 # Multiplier applied to the request rate on a 429
+RATE_INCREASE = 0.05 # Fraction the request rate grows by after each success
+MIN_RATE = 0.05 # Requests/sec
+
+SALESFORCE_QUERY = (
+    'SELECT Id, Account.Name, Amount, CloseDate, Owner.Name, StageName, Product_Type__c, LeadSource '
+    'FROM Opportunity WHERE IsClosed = true'
+)
+ADS_QUERY = (
+    'SELECT campaign.id, campaign.name, segments.date, metrics.cost_micros, metrics.impressions, '
+    'metrics.clicks FROM campaign'
+)
+
+
+class IngestionError(Exception):
+    """Raised when a page can't be fetched after all retries."""
+
+
+class AdaptiveRateLimiter:
+    """Paces one API's requests to the rate it actually allows, learned from its 429s (AIMD).
+
+    Until the first 429 requests go out unpaced; the rate is then seeded from how many requests
+    got through in the last second. Requests leave one at a time, evenly spaced and never before
+    the server's Retry-After, so workers don't all fire the moment a limit resets. Each 429 halves
+    the rate, but only once per epoch: requests already in flight were sent at the old rate, so
+    their 429s carry no new information. Every success raises the rate a little to find the limit again.
+    """
+
+    def __init__(self):
+        self.rate = None # Requests/sec; None until the API first rate limits us
+        self.next_slot = 0.0
+        self.epoch = 0
+        self.lock = asyncio.Lock()
+        self.recent_successes = collections.deque() # Over the last second, to seed the rate
+
+    async def acquire(self):
+        """Waits for this request's turn and returns the epoch it was sent in."""
+        async with self.lock:
+            # Re-checked after each sleep, since a 429 meanwhile may have pushed the slot back
+            while (delay := self.next_slot - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            if self.rate:
+                self.next_slot = time.monotonic() + 1 / self.rate
+        return self.epoch
+
+    def record_success(self):
+        now = time.monotonic()
+        self.recent_successes.append(now)
+        while self.recent_successes[0] < now - 1:
+            self.recent_successes.popleft()
+        if self.rate:
+            self.rate *= 1 + RATE_INCREASE
+
+    def record_rate_limited(self, epoch, retry_after):
+        if epoch == self.epoch:
+            if self.rate is None:
+                self.rate = max(MIN_RATE, len(self.recent_successes) or 1 / max(retry_after, 1 / MIN_RATE))
+            else:
+                self.rate = max(MIN_RATE, self.rate * RATE_DECREASE)
+            self.epoch += 1
+        self.next_slot = max(self.next_slot, time.monotonic() + retry_after)
+
+
+# --- Helper Functions ---
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def parse_retry_after(response, attempt):
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return backoff_delay(attempt)
+
+
+def monthly_windows(start=SYNC_WINDOWS_START):
+    """(start, end) Timestamps for each calendar month from `start` through this month.
+
+    The first and last windows are open-ended (None), so nothing outside the range is missed.
+    """
+    bounds = list(pd.date_range(start, pd.Timestamp.today() + pd.offsets.MonthBegin(1), freq='MS'))
+    return list(zip([None] + bounds, bounds + [None]))
+
+
+async def request_json(client, limiter, method, url, **kwargs):
+    """Sends one API request, retrying transient errors with backoff and waiting out rate limits.
+
+    Only transport errors and 5xx responses count against MAX_RETRIES. A 429 just means
+    "slow down": the limiter lowers the pace and the request is retried for up to
+    RATE_LIMIT_MAX_WAIT_SECONDS.
+    """
+    failures = 0
+    rate_limited_since = None
+    while True:
+        epoch = await limiter.acquire()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if failures == MAX_RETRIES:
+                raise IngestionError(f"{method} {url}: {e}") from e
+            failures += 1
+            await asyncio.sleep(backoff_delay(failures))
+            continue
+
+        if response.status_code == 200:
+            limiter.record_success()
+            return response.json()
+        if response.status_code == 429:
+            rate_limited_since = rate_limited_since or time.monotonic()
+            if time.monotonic() - rate_limited_since > RATE_LIMIT_MAX_WAIT_SECONDS:
+                raise IngestionError(f"{method} {url}: still rate limited after {RATE_LIMIT_MAX_WAIT_SECONDS:.0f}s")
+            limiter.record_rate_limited(epoch, parse_retry_after(response, failures))
+            continue
+        if response.status_code not in RETRYABLE_STATUS_CODES or failures == MAX_RETRIES:
+            raise IngestionError(f"{method} {url}: HTTP {response.status_code}")
+        failures += 1
+        await asyncio.sleep(backoff_delay(failures))
+
+
+# --- Pagination Adapters ---
+# One per source API. Each knows how to split its API into partitions that can be paged
+# concurrently, follows that API's own cursor style, and maps its records back to the
+# column layout of the matching CSV export so the same cleaning rules apply.
+class PaginationAdapter:
+    columns = []
+    renames = {}
+    clean = None
+
+    async def fetch_pages(self, fetch, page_size, emit, tasks):
+        """Hands each page's records to `emit`, using the `tasks` TaskGroup for concurrent partitions."""
+        raise NotImplementedError
+
+    def to_frame(self, records):
+        if not records:
+            return pd.DataFrame(columns=self.columns)
+        return pd.json_normalize(records).rename(columns=self.renames).reindex(columns=self.columns)
+
+
+class SalesforceAdapter(PaginationAdapter):
+    """REST query API: the first batch reports totalSize and a nextRecordsUrl locator.
+
+    Locators end in '-<offset>', so once the first batch is in, every remaining batch
+    can be requested concurrently instead of following nextRecordsUrl one at a time.
+    """
+
+    columns = ['OpportunityID', 'AccountName', 'Amount', 'CloseDate', 'OwnerName', 'StageName', 'ProductType', 'LeadSource']
+    renames = {'Id': 'OpportunityID', 'Account.Name': 'AccountName', 'Owner.Name': 'OwnerName', 'Product_Type__c': 'ProductType'}
+    clean = staticmethod(clean_crm)
+
+    async def fetch_pages(self, fetch, page_size, emit, tasks):
+        headers = {'Sforce-Query-Options': f'batchSize={page_size}'}
+        first = await fetch('GET', '/services/data/v59.0/query', params={'q': SALESFORCE_QUERY}, headers=headers)
+        await emit(first['records'])
+        if first['done']:
+            return
+
+        locator = first['nextRecordsUrl'].rsplit('-', 1)[0]
+        batch_size = len(first['records']) # The API may adjust the requested batch size
+
+        async def fetch_batch(offset):
+            page = await fetch('GET', f'{locator}-{offset}', headers=headers)
+            await emit(page['records'])
+
+        for offset in range(batch_size, first['totalSize'], batch_size):
+            tasks.create_task(fetch_batch(offset))
+
+
+class StripeAdapter(PaginationAdapter):
+    """List API paged with starting_after/has_more; monthly created[gte]/created[lt] windows run concurrently."""
+
+    columns = ['PaymentID', 'Amount', 'PaymentDate', 'Description', 'Status']
+    renames = {'id': 'PaymentID', 'amount': 'Amount', 'created': 'PaymentDate', 'description': 'Description', 'status': 'Status'}
+    clean = staticmethod(clean_finance)
+    max_page_size = 100
+
+    async def fetch_pages(self, fetch, page_size, emit, tasks):
+        async def fetch_window(start, end):
+            params = {'limit': min(page_size, self.max_page_size)}
+            if start is not None:
+                params['created[gte]'] = int(start.timestamp())
+            if end is not None:
+                params['created[lt]'] = int(end.timestamp())
+            while True:
+                page = await fetch('GET', '/v1/charges', params=params)
+                await emit(page['data'])
+                if not page['has_more']:
+                    return
+                params['starting_after'] = page['data'][-1]['id']
+
+        for start, end in monthly_windows():
+            tasks.create_task(fetch_window(start, end))
+
+    def to_frame(self, records):
+        page_df = super().to_frame(records)
+        page_df['Amount'] = pd.to_numeric(page_df['Amount']) / 100 # Stripe amounts are in cents
+        page_df['PaymentDate'] = pd.to_datetime(page_df['PaymentDate'], unit='s')
+        return page_df
+
+
+class HubSpotAdapter(PaginationAdapter):
+    """CRM search API paged with paging.next.after.
+
+    A one-record probe returns the total; ids are assigned in creation order, so equal
+    hs_object_id ranges split the work evenly. The last range is open-ended to pick up
+    anything created after the probe.
+    """
+
+    columns = ['ContactEmail', 'TouchpointDate', 'CampaignSource', 'ActionType', 'AssociatedOpportunityID']
+    renames = {
+        'properties.email': 'ContactEmail',
+        'properties.touchpoint_date': 'TouchpointDate',
+        'properties.campaign_source': 'CampaignSource',
+        'properties.action_type': 'ActionType',
+        'properties.associated_opportunity_id': 'AssociatedOpportunityID',
+    }
+    clean = staticmethod(clean_marketing)
+    search_path = '/crm/v3/objects/touches/search'
+    max_page_size = 200
+
+    async def fetch_pages(self, fetch, page_size, emit, tasks):
+        probe = await fetch('POST', self.search_path, json={'limit': 1})
+        range_size = max(-(-probe['total'] // HUBSPOT_PARTITIONS), 1)
+
+        async def fetch_range(low, high):
+            filters = [{'propertyName': 'hs_object_id', 'operator': 'GTE', 'value': str(low)}]
+            if high is not None:
+                filters.append({'propertyName': 'hs_object_id', 'operator': 'LT', 'value': str(high)})
+            body = {'limit': min(page_size, self.max_page_size), 'filterGroups': [{'filters': filters}]}
+            while True:
+                page = await fetch('POST', self.search_path, json=body)
+                await emit(page['results'])
+                if 'paging' not in page:
+                    return
+                body['after'] = page['paging']['next']['after']
+
+        lows = list(range(0, probe['total'], range_size)) or [0]
+        for low, high in zip(lows, lows[1:] + [None]):
+            tasks.create_task(fetch_range(low, high))
+
+
+class AdPlatformAdapter(PaginationAdapter):
+    """Reporting search API paged with nextPageToken; monthly segments.date windows run concurrently."""
+
+    columns = ['CampaignID', 'CampaignName', 'Date', 'Spend', 'SourcePlatform', 'Impressions', 'Clicks']
+    renames = {
+        'campaign.id': 'CampaignID',
+        'campaign.name': 'CampaignName',
+        'segments.date': 'Date',
+        'metrics.costMicros': 'Spend',
+        'adPlatform': 'SourcePlatform',
+        'metrics.impressions': 'Impressions',
+        'metrics.clicks': 'Clicks',
+    }
+    clean = staticmethod(clean_ad_spend)
+    max_page_size = 10000
+
+    async def fetch_pages(self, fetch, page_size, emit, tasks):
+        async def fetch_window(start, end):
+            conditions = []
+            if start is not None:
+                conditions.append(f"segments.date >= '{start:%Y-%m-%d}'")
+            if end is not None:
+                conditions.append(f"segments.date < '{end:%Y-%m-%d}'")
+            body = {'query': f"{ADS_QUERY} WHERE {' AND '.join(conditions)}", 'pageSize': min(page_size, self.max_page_size)}
+            while True:
+                page = await fetch('POST', '/ads/v1/customers/mock/spend:search', json=body)
+                await emit(page['results'])
+                if not page.get('nextPageToken'):
+                    return
+                body['pageToken'] = page['nextPageToken']
+
+        for start, end in monthly_windows():
+            tasks.create_task(fetch_window(start, end))
+
+    def to_frame(self, records):
+        page_df = super().to_frame(records)
+        page_df['Spend'] = pd.to_numeric(page_df['Spend']) / 1_000_000 # Cost is reported in micros
+        return page_df
+
+
+# Source name -> adapter. Names match the DataFrames commission_analyzer.py builds.
+SOURCE_ADAPTERS = {
+    'crm': SalesforceAdapter(),
+    'finance': StripeAdapter(),
+    'marketing': HubSpotAdapter(),
+    'ad_spend': AdPlatformAdapter(),
+}
+
+
+async def ingest_source(client, source, page_size=PAGE_SIZE):
+    """Fetches one source's partitions concurrently and cleans each page as it arrives.
+
+    Pages pass through a bounded queue to a single consumer, which converts and cleans them
+    and keeps only the cleaned frame, so raw JSON pages are released as soon as they are cleaned.
+    """
+    adapter = SOURCE_ADAPTERS[source]
+    limiter = AdaptiveRateLimiter() # Rate limits are per API, so each source paces itself
+    fetch = lambda method, url, **kwargs: request_json(client, limiter, method, url, **kwargs)
+    queue = asyncio.Queue(maxsize=QUEUE_PAGES)
+    cleaned_pages = []
+
+    async def clean_pages():
+        while (records := await queue.get()) is not None:
+            if records:
+                cleaned_pages.append(adapter.clean(adapter.to_frame(records)))
+
+    # If any fetch fails the TaskGroups cancel every sibling, including the cleaning consumer
+    async with asyncio.TaskGroup() as consumer:
+        consumer.create_task(clean_pages())
+        async with asyncio.TaskGroup() as fetchers:
+            fetchers.create_task(adapter.fetch_pages(fetch, page_size, queue.put, fetchers))
+        await queue.put(None) # Sentinel: every partition has been read
+
+    if not cleaned_pages:
+        return adapter.clean(adapter.to_frame([])) # Typed, empty frame with the expected columns
+    return pd.concat(cleaned_pages, ignore_index=True)
+
+
+async def ingest_all(base_url, sources=SOURCE_ADAPTERS, max_connections=MAX_CONNECTIONS, **source_options):
+    """Ingests every source concurrently over one pooled client. Returns {source: cleaned DataFrame}."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    # No pool timeout: requests queued behind the connection limit are waiting their turn, not failing
+    timeout = httpx.Timeout(30.0, pool=None)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+            async with asyncio.TaskGroup() as tasks:
+                ingesting = {
+                    source: tasks.create_task(ingest_source(client, source, **source_options)) for source in sources
+                }
+    except ExceptionGroup as group:
+        # The TaskGroups already cancelled every other fetch; surface the error that stopped them
+        error = group
+        while isinstance(error, ExceptionGroup):
+            error = error.exceptions[0]
+        raise error
+    return {source: task.result() for source, task in ingesting.items()}
+
+
+# --- Benchmark against the local mock API (no network access needed) ---
+def benchmark_run(server_options, page_size, trace_memory):
+    """Ingests once from a fresh mock API process. Returns (records, seconds, peak traced bytes or None)."""
+    from mock_api_server import start_mock_server_process
+
+    server, base_url = start_mock_server_process(**server_options)
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        ingested = asyncio.run(ingest_all(base_url, page_size=page_size))
+        elapsed = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        tracemalloc.stop()
+        server.terminate()
+    return {source: len(df) for source, df in ingested.items()}, elapsed, peak_memory
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure ingestion throughput and memory against the mock API.')
+    parser.add_argument('--scale', type=int, default=100, help='Repeat the generated data this many times')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--rate-limit', type=float, default=None, help='Mock API requests per second, per API')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of mock API requests that return 503')
+    args = parser.parse_args()
+    server_options = {'scale': args.scale, 'rate_limit': args.rate_limit, 'failure_rate': args.failure_rate}
+    print(f"Benchmarking against the mock API in a separate process (scale x{args.scale})")
+
+    # Throughput is timed without tracemalloc, which slows every allocation down considerably;
+    # client memory is then measured in a second, separate run
+    record_counts, elapsed, _ = benchmark_run(server_options, args.page_size, trace_memory=False)
+    for source, count in record_counts.items():
+        print(f"Ingested {count} {source} records")
+    total_records = sum(record_counts.values())
+    print(f"\nTotal: {total_records} records in {elapsed:.2f}s ({total_records / elapsed:,.0f} records/sec)")
+
+    _, traced_elapsed, peak_memory = benchmark_run(server_options, args.page_size, trace_memory=True)
+    print(f"Peak client memory (traced run, {traced_elapsed:.2f}s): {peak_memory / 1024 ** 2:.1f} MB")
\ No newline at end of file
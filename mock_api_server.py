@@ -0,0 +1,384 @@
+import base64
+import bisect
+import csv
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- Configuration ---
+# Each source serves one of the files written by generate_data.py, shaped like the API it stands in for
+SOURCE_FILES = {
+    'crm': 'crm_closed_deals.csv', # Salesforce REST query API
+    'finance': 'finance_payments.csv', # Stripe list API
+    'marketing': 'marketing_touches.csv', # HubSpot CRM search API
+    'ad_spend': 'ad_spend.csv', # Ad platform reporting search API
+}
+SALESFORCE_QUERY_PATH = '/services/data/v59.0/query'
+STRIPE_CHARGES_PATH = '/v1/charges'
+HUBSPOT_SEARCH_PATH = '/crm/v3/objects/touches/search'
+ADS_SEARCH_PATH = '/ads/v1/customers/mock/spend:search'
+SALESFORCE_LOCATOR = '01gMOCKQUERYLOC'
+
+# Page size limits of the real APIs
+SALESFORCE_BATCH_SIZE = (200, 2000) # Min/Max, requested via the Sforce-Query-Options header
+STRIPE_MAX_LIMIT = 100
+HUBSPOT_MAX_LIMIT = 200
+ADS_MAX_PAGE_SIZE = 10000
+
+
+# --- Helper Functions ---
+def load_source_rows(source_files):
+    """Loads each source's CSV into a list of dicts (empty cells become None, like JSON nulls)."""
+    source_rows = {}
+    for source, file_name in source_files.items():
+        with open(file_name, newline='') as f:
+            source_rows[source] = [
+                {key: (value if value != '' else None) for key, value in row.items()}
+                for row in csv.DictReader(f)
+            ]
+    return source_rows
+
+
+def to_unix_seconds(date_text):
+    """'YYYY-MM-DD' -> Unix timestamp (UTC midnight), like Stripe's `created`."""
+    return int(datetime.fromisoformat(date_text).replace(tzinfo=timezone.utc).timestamp())
+
+
+class MockDataset:
+    """Rows of one source, optionally sorted by a key the API can filter on.
+
+    `scale` repeats the dataset virtually so large volumes can be served without holding copies
+    in memory: position p is base row p // scale, and repeats get a '-r<k>' suffix on their ID.
+    """
+
+    def __init__(self, rows, scale=1, id_field=None, sort_key=None):
+        self.rows = sorted(rows, key=sort_key) if sort_key else rows
+        self.scale = scale
+        self.id_field = id_field
+        self.sort_keys = [sort_key(row) for row in self.rows] if sort_key else None
+        self.positions = {row[id_field]: i for i, row in enumerate(self.rows)} if id_field else {}
+
+    def __len__(self):
+        return len(self.rows) * self.scale
+
+    def row(self, position):
+        row = self.rows[position // self.scale]
+        replica = position % self.scale
+        if replica and self.id_field:
+            row = dict(row, **{self.id_field: f"{row[self.id_field]}-r{replica}"})
+        return row
+
+    def position_of(self, row_id):
+        base_id, _, replica = row_id.rpartition('-r') if '-r' in row_id else (row_id, '', '0')
+        return self.positions[base_id] * self.scale + int(replica)
+
+    def key_range(self, low=None, high=None):
+        """Positions [start, end) whose sort key is >= low and < high (either bound may be None)."""
+        start = bisect.bisect_left(self.sort_keys, low) if low is not None else 0
+        end = bisect.bisect_left(self.sort_keys, high) if high is not None else len(self.rows)
+        return start * self.scale, max(start, end) * self.scale
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to simulate an API rate limit."""
+
+    def __init__(self, rate_per_second):
+        self.rate = rate_per_second
+        # Capacity of at least one token, otherwise rates below 1/sec could never grant a request
+        self.capacity = max(1.0, rate_per_second)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """Takes a token if one is available, otherwise returns the seconds until the next one."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+# --- Record Shapes (how each real API returns one row) ---
+def salesforce_opportunity(row):
+    return {
+        'attributes': {'type': 'Opportunity', 'url': f"/services/data/v59.0/sobjects/Opportunity/{row['OpportunityID']}"},
+        'Id': row['OpportunityID'],
+        'Account': {'Name': row['AccountName']},
+        'Amount': float(row['Amount']) if row['Amount'] is not None else None,
+        'CloseDate': row['CloseDate'],
+        'Owner': {'Name': row['OwnerName']},
+        'StageName': row['StageName'],
+        'Product_Type__c': row['ProductType'],
+        'LeadSource': row['LeadSource'],
+    }
+
+
+def stripe_charge(row):
+    return {
+        'id': row['PaymentID'],
+        'object': 'charge',
+        'amount': round(float(row['Amount']) * 100) if row['Amount'] is not None else None, # In cents
+        'currency': 'usd',
+        'created': to_unix_seconds(row['PaymentDate']),
+        'description': row['Description'],
+        'status': row['Status'],
+    }
+
+
+def hubspot_touch(position, row):
+    return {
+        'id': str(position),
+        'properties': {
+            'email': row['ContactEmail'],
+            'touchpoint_date': row['TouchpointDate'],
+            'campaign_source': row['CampaignSource'],
+            'action_type': row['ActionType'],
+            'associated_opportunity_id': row['AssociatedOpportunityID'],
+        },
+    }
+
+
+def ads_spend_row(row):
+    # Like Google Ads, 64-bit metrics come back as strings and cost is in micros
+    return {
+        'campaign': {'id': row['CampaignID'], 'name': row['CampaignName']},
+        'segments': {'date': row['Date']},
+        'metrics': {
+            'costMicros': str(round(float(row['Spend']) * 1_000_000)) if row['Spend'] is not None else None,
+            'impressions': row['Impressions'],
+            'clicks': row['Clicks'],
+        },
+        'adPlatform': row['SourcePlatform'],
+    }
+
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    """Serves the generated data through four API shapes, each paginated its own way:
+
+      Salesforce   GET  /services/data/v59.0/query?q=...        nextRecordsUrl (query locator)
+      Stripe       GET  /v1/charges?created[gte]=&created[lt]=  starting_after / has_more
+      HubSpot      POST /crm/v3/objects/touches/search          paging.next.after (hs_object_id GTE/LT filters)
+      Ad platform  POST /ads/v1/customers/mock/spend:search     nextPageToken (segments.date >= / < conditions)
+    """
+
+    protocol_version = 'HTTP/1.1' # Keep-alive, so client connection pooling actually reuses sockets
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == SALESFORCE_QUERY_PATH or url.path.startswith(f"{SALESFORCE_QUERY_PATH}/"):
+            self.handle_api('crm', self.salesforce_query, url.path, query)
+        elif url.path == STRIPE_CHARGES_PATH:
+            self.handle_api('finance', self.stripe_list, query)
+        else:
+            self.send_json(404, {'error': f'Unknown endpoint {url.path}'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            return self.send_json(400, {'error': 'Invalid JSON body'})
+        if url.path == HUBSPOT_SEARCH_PATH:
+            self.handle_api('marketing', self.hubspot_search, body)
+        elif url.path == ADS_SEARCH_PATH:
+            self.handle_api('ad_spend', self.ads_search, body)
+        else:
+            self.send_json(404, {'error': f'Unknown endpoint {url.path}'})
+
+    def handle_api(self, source, build_page, *request):
+        """Applies the API's own rate limit and the injected failures, then serves the page."""
+        server = self.server
+        limiter = server.rate_limiters.get(source)
+        wait = limiter.try_acquire() if limiter else 0.0
+        if wait > 0:
+            return self.send_json(429, {'error': 'Rate limit exceeded'}, {'Retry-After': f'{wait:.3f}'})
+        if server.failure_rate and random.random() < server.failure_rate:
+            return self.send_json(503, {'error': 'Service temporarily unavailable'})
+        try:
+            page = build_page(server.datasets[source], *request)
+        except (KeyError, ValueError) as e:
+            return self.send_json(400, {'error': f'Invalid request: {e}'})
+        self.send_json(200, page)
+
+    def salesforce_query(self, dataset, path, query):
+        # The first batch comes from ?q=, later ones from the nextRecordsUrl locator
+        if path == SALESFORCE_QUERY_PATH:
+            if not query.get('q'):
+                raise ValueError('missing q')
+            offset = 0
+        else:
+            locator, _, offset = path.rsplit('/', 1)[1].rpartition('-')
+            if locator != SALESFORCE_LOCATOR:
+                raise KeyError(locator)
+            offset = int(offset)
+
+        options = dict(
+            option.strip().split('=', 1)
+            for option in self.headers.get('Sforce-Query-Options', '').split(',') if '=' in option
+        )
+        batch_size = int(options.get('batchSize', SALESFORCE_BATCH_SIZE[1]))
+        batch_size = min(max(batch_size, SALESFORCE_BATCH_SIZE[0]), SALESFORCE_BATCH_SIZE[1])
+        end = min(offset + batch_size, len(dataset))
+        page = {
+            'totalSize': len(dataset),
+            'done': end >= len(dataset),
+            'records': [salesforce_opportunity(dataset.row(i)) for i in range(offset, end)],
+        }
+        if not page['done']:
+            page['nextRecordsUrl'] = f"{SALESFORCE_QUERY_PATH}/{SALESFORCE_LOCATOR}-{end}"
+        return page
+
+    def stripe_list(self, dataset, query):
+        # Charges after `starting_after`, within an optional created[gte]/created[lt] window
+        limit = min(int(query.get('limit', 10)), STRIPE_MAX_LIMIT)
+        start, end = dataset.key_range(
+            int(query['created[gte]']) if 'created[gte]' in query else None,
+            int(query['created[lt]']) if 'created[lt]' in query else None
+        )
+        if 'starting_after' in query:
+            start = max(start, dataset.position_of(query['starting_after']) + 1)
+        page_end = min(start + limit, end)
+        return {
+            'object': 'list',
+            'url': STRIPE_CHARGES_PATH,
+            'has_more': page_end < end,
+            'data': [stripe_charge(dataset.row(i)) for i in range(start, page_end)],
+        }
+
+    def hubspot_search(self, dataset, body):
+        # Search restricted by hs_object_id GTE/LT filters, paged by the `after` cursor
+        limit = min(int(body.get('limit', 10)), HUBSPOT_MAX_LIMIT)
+        start, end = 0, len(dataset)
+        for group in body.get('filterGroups', []):
+            for f in group.get('filters', []):
+                if f.get('propertyName') != 'hs_object_id':
+                    continue
+                if f.get('operator') == 'GTE':
+                    start = max(start, int(f['value']))
+                elif f.get('operator') == 'LT':
+                    end = min(end, int(f['value']))
+        page_start = max(start, int(body['after'])) if body.get('after') else start
+        page_end = min(page_start + limit, end)
+        page = {
+            'total': max(0, end - start),
+            'results': [hubspot_touch(i, dataset.row(i)) for i in range(page_start, page_end)],
+        }
+        if page_end < end:
+            page['paging'] = {'next': {'after': str(page_end)}}
+        return page
+
+    def ads_search(self, dataset, body):
+        # GAQL-style query with optional segments.date >= / < conditions, paged by an opaque token
+        page_size = min(int(body.get('pageSize', ADS_MAX_PAGE_SIZE)), ADS_MAX_PAGE_SIZE)
+        date_bounds = [
+            re.search(rf"segments\.date {operator} '([\d-]+)'", body.get('query', '')) for operator in ('>=', '<')
+        ]
+        start, end = dataset.key_range(*[bound.group(1) if bound else None for bound in date_bounds])
+        if body.get('pageToken'):
+            start = int(base64.urlsafe_b64decode(body['pageToken']).decode())
+        page_end = min(start + page_size, end)
+        page = {
+            'results': [ads_spend_row(dataset.row(i)) for i in range(start, page_end)],
+            'totalResultsCount': str(end - start),
+        }
+        if page_end < end:
+            page['nextPageToken'] = base64.urlsafe_b64encode(str(page_end).encode()).decode()
+        return page
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Silence per-request logging so benchmarks aren't dominated by console output
+
+
+def create_mock_server(host='127.0.0.1', port=0, scale=1, rate_limit=None, failure_rate=0.0,
+                       source_files=SOURCE_FILES):
+    """Builds (without starting) the mock API server.
+
+    port=0 picks a free port. rate_limit is requests per second, enforced per API like the
+    real vendors do (None disables it); failure_rate is the share of requests answered with
+    a 503 to exercise client retries.
+    """
+    rows = load_source_rows(source_files)
+    server = ThreadingHTTPServer((host, port), MockAPIHandler)
+    server.daemon_threads = True
+    server.datasets = {
+        'crm': MockDataset(rows['crm'], scale, id_field='OpportunityID'),
+        'finance': MockDataset(rows['finance'], scale, id_field='PaymentID',
+                               sort_key=lambda row: to_unix_seconds(row['PaymentDate'])),
+        'marketing': MockDataset(rows['marketing'], scale),
+        'ad_spend': MockDataset(rows['ad_spend'], scale, sort_key=lambda row: row['Date']),
+    }
+    server.rate_limiters = {source: TokenBucket(rate_limit) for source in server.datasets} if rate_limit else {}
+    server.failure_rate = failure_rate
+    return server
+
+
+def start_mock_server(**options):
+    """Starts the mock API in a background thread and returns (server, base_url).
+
+    Takes the same options as create_mock_server(). Call server.shutdown() when done.
+    """
+    server = create_mock_server(**options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+
+
+def serve_mock_server(connection, options):
+    """Subprocess entry point: builds the server, reports its base URL, then serves until terminated."""
+    server = create_mock_server(**options)
+    connection.send(f"http://{server.server_address[0]}:{server.server_address[1]}")
+    connection.close()
+    server.serve_forever()
+
+
+def start_mock_server_process(**options):
+    """Starts the mock API in its own process and returns (process, base_url).
+
+    Benchmarks use this so the server's request handling doesn't compete with the client for
+    the same interpreter, and the client's measured memory is its own. Takes the same options
+    as create_mock_server(). Call process.terminate() when done.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=serve_mock_server, args=(sender, options), daemon=True)
+    process.start()
+    sender.close() # So recv() raises EOFError instead of hanging if the server fails to start
+    try:
+        base_url = receiver.recv()
+    except EOFError:
+        process.join()
+        raise RuntimeError(f"Mock API server exited during startup (exit code {process.exitcode})")
+    return process, base_url
+
+
+if __name__ == '__main__':
+    server, base_url = start_mock_server(port=8000)
+    print(f"Mock API serving generated data at {base_url}")
+    for source, dataset in server.datasets.items():
+        print(f"  {source} ({len(dataset)} records)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
\ No newline at end of file